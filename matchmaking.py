@@ -3,10 +3,16 @@
 import argparse
 from typing import *
 from timeout import timeout, TimeoutError
-from itertools import permutations
+from itertools import accumulate, permutations, product
+from bisect import bisect_left, insort
 from statistics import mean, stdev
+from collections import OrderedDict
+from math import isclose
+import io
+import json
 import random as rd
 import sys
+import time
 
 # https://pypi.org/project/recordclass/
 from recordclass import recordclass, RecordClass # type: ignore
@@ -14,7 +20,6 @@ from recordclass import recordclass, RecordClass # type: ignore
 seed = rd.randrange(sys.maxsize)
 #seed = 3399729631327393780
 rng = rd.Random(seed)
-print("Seed:", seed)
 
 nDays = 2 # number of available days
 
@@ -350,6 +355,13 @@ def to_bool_list(n: int, size: int) -> List[bool]:
     return bools
 
 
+def from_bool_list(bools: List[bool]) -> int:
+    n = 0
+    for b in bools:
+        n = 2*n + int(b)
+    return n
+
+
 def create_tables_fixed_days(playersInfo: PlayersInfo, day1Players: List[Name],
                              day2Players: List[Name]) -> Optional[List[List[Name]]]:
     if len(day1Players) > 0:
@@ -376,57 +388,112 @@ def get_tables_score(playersInfo: PlayersInfo, tables: List[List[Name]]) -> Tupl
         score -= max(table) * sum([max(table)-pl for pl in table])
 
     # Subscore: comparing the stdev of the two best tables
-    tablesSorted = sorted(playerScores, key=max, reverse=True)
-    subscore = -stdev([mean(table) for table in tablesSorted[0:2]])
+    subscore = 0.0
+    if len(playerScores) >= 2:
+        tablesSorted = sorted(playerScores, key=max, reverse=True)
+        subscore = -stdev([mean(table) for table in tablesSorted[0:2]])
     return (score, subscore)
 
 
-@timeout(30)
-def exhaustive_search(playersInfo: PlayersInfo) -> Optional[Solution]:
-    bestTables = None
-    day1Only = [player for player in playersInfo
-                       if playersInfo[player].daysOk == [True, False]]
-    day2Only = [player for player in playersInfo
-                       if playersInfo[player].daysOk == [False, True]]
-    day12 = [player for player in playersInfo
-                    if playersInfo[player].daysOk == [True, True]]
-    for daysIter in range(2**len(day12)):
-        if len(day12) == 0:
-            day1Players = list(day1Only)
-            day2Players = list(day2Only)
-            bestTables = create_tables_fixed_days(playersInfo, day1Players, day2Players)
-            if bestTables is None:
-                continue
-            bestScore = get_tables_score(playersInfo, bestTables)
-            break
-        dayDecisions = to_bool_list(daysIter, len(day12))
-        day1Players = list(day1Only)
-        day2Players = list(day2Only)
-        for i, player in enumerate(day12):
+##
+# Exhaustive search over the day assignments of the players available both days.
+# It can stop at a deadline and be picked up later where it stopped.
+##
+progressInterval = 0.5 # seconds
+
+class SearchState():
+    def __init__(self, playersInfo: PlayersInfo, hint: Optional[Dict[Name, Day]] = None) -> None:
+        self.playersInfo = playersInfo
+        self.day1Only = [player for player in playersInfo
+                                if playersInfo[player].daysOk == [True, False]]
+        self.day2Only = [player for player in playersInfo
+                                if playersInfo[player].daysOk == [False, True]]
+        self.day12 = sorted(player for player in playersInfo
+                                   if playersInfo[player].daysOk == [True, True])
+        self.total = 2**len(self.day12)
+        self.nextIter = 0
+        self.explored = 0 # number of assignments actually tried
+        self.bestTables: List[List[List[Name]]] = []
+        self.bestScore: Optional[Tuple[float, float]] = None
+        # Day assignment to try first, taken from a previous similar roster
+        self.hintIter: Optional[int] = None
+        self.hintTried = False
+        # Longest time split_exhaustive_search was given on this roster
+        self.splitBudget = 0.0
+        if hint is not None:
+            self.hintIter = from_bool_list([hint.get(player, 0) == 1 for player in self.day12])
+
+    @property
+    def complete(self) -> bool:
+        return self.nextIter >= self.total
+
+    def try_days(self, daysIter: int) -> None:
+        self.explored += 1
+        dayDecisions = to_bool_list(daysIter, len(self.day12))
+        day1Players = list(self.day1Only)
+        day2Players = list(self.day2Only)
+        for i, player in enumerate(self.day12):
             if dayDecisions[i]:
                 day2Players.append(player)
             else:
                 day1Players.append(player)
-        tables = create_tables_fixed_days(playersInfo, day1Players, day2Players)
-        if tables is None:
-            continue
-        score = get_tables_score(playersInfo, tables)
-        if bestTables is None or score > bestScore:
-            bestTables = [tables] # type: ignore
-            bestScore = score
-        elif score == bestScore:
-            bestTables.append(tables) # type: ignore
-        #if score==bestScore:
-        #    print(80*"-")
-        #    print(tables)
-        #    print("\t", score)
-
-    #print("best score:", bestScore)
-    if bestTables is None:
+        tables = create_tables_fixed_days(self.playersInfo, day1Players, day2Players)
+        if tables is not None:
+            self.keep(tables)
+
+    def keep(self, tables: List[List[Name]]) -> None:
+        score = get_tables_score(self.playersInfo, tables)
+        if self.bestScore is None or score > self.bestScore:
+            self.bestTables = [tables]
+            self.bestScore = score
+        elif score == self.bestScore:
+            self.bestTables.append(tables)
+
+    def try_hint(self) -> None:
+        if self.hintIter is not None and not self.hintTried:
+            self.try_days(self.hintIter)
+            self.hintTried = True
+
+    def run(self, deadline: float = float("inf"),
+            progress: Optional[Callable[["SearchState"], None]] = None) -> None:
+        self.try_hint()
+        lastProgress = time.monotonic()
+        while not self.complete:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if progress is not None and now - lastProgress >= progressInterval:
+                progress(self)
+                lastProgress = now
+            if self.nextIter != self.hintIter:
+                self.try_days(self.nextIter)
+            self.nextIter += 1
+
+    # Ends the search with the best tables found by another exhaustive search
+    def finish(self, bestTables: List[List[List[Name]]]) -> None:
+        for tables in bestTables:
+            self.keep(tables)
+        self.nextIter = self.total
+
+    def best_days(self) -> Dict[Name, Day]:
+        if not self.bestTables:
+            return {}
+        solution = tables_to_solution(self.playersInfo, self.bestTables[0])
+        return {player: solution[player].day for player in self.day12}
+
+
+@timeout(30)
+def exhaustive_search(playersInfo: PlayersInfo) -> Optional[Solution]:
+    state = SearchState(playersInfo)
+    state.run()
+    if not state.bestTables:
         return None
-    tables = rng.choice(bestTables) # type: ignore
+    return tables_to_solution(playersInfo, rng.choice(state.bestTables))
+
+
+def tables_to_solution(playersInfo: PlayersInfo, tables: List[List[Name]]) -> Solution:
     solution = {}
-    for i, tablePlayers in enumerate(tables): # type: ignore
+    for i, tablePlayers in enumerate(tables):
         day = deduce_day(playersInfo, tablePlayers)
         assert(day is not None)
         for player in tablePlayers:
@@ -434,10 +501,343 @@ def exhaustive_search(playersInfo: PlayersInfo) -> Optional[Solution]:
     return solution
 
 
+##
+# Meet-in-the-middle variant of exhaustive_search.
+#
+# The main score is a sum over tables, and the tables of a day are contiguous
+# bands of its players sorted by score. The players available both days are
+# split at a score boundary: the assignments of the top half and of the bottom
+# half are enumerated separately, and then joined on the number of day-1 players
+# on each side of the boundary (which fixes the table layout of both days).
+# Only one table per day can straddle the boundary; its score is
+#   -M * sum(M - pl) = -size*M^2 + M*sum(top players) + M*sum(bottom players)
+# so the top half carries the max M of that table, and the bottom half the sum
+# of its own players in that table.
+# Players of equal score are interchangeable, so each half only enumerates how
+# many players of each score go on day 1.
+##
+Layout = Tuple[Tuple[int, int], ...] # (first position, size) of each table of a day
+BottomLayout = Tuple[Layout, int] # tables below the boundary, and bottom players of the straddling table
+ScoreGroups = List[Tuple[Score, List[Name]]]
+Counts = Tuple[int, ...] # number of players of each score group going on day 1
+# For each day, max of the straddling table (top half) or sum of its bottom
+# players (bottom half), 0 if no table straddles the boundary
+Straddle = Tuple[Score, Score]
+HalfScores = Dict[Straddle, Tuple[float, List[Counts]]]
+
+
+def day_layout(n: int) -> Optional[Layout]:
+    if n == 0:
+        return ()
+    cutByFour = cut_by_four(n)
+    if cutByFour is None:
+        return None
+    layout = []
+    start = 0
+    for size in sorted(cutByFour, reverse=True):
+        layout.append((start, size))
+        start += size
+    return tuple(layout)
+
+
+# Tables starting above the boundary, the top half holding the c first players of the day
+def top_tables(layout: Layout, c: int) -> Layout:
+    return tuple(table for table in layout if table[0] < c)
+
+
+# Tables starting below the boundary, relative to the boundary, and the number
+# of bottom players in the straddling table
+def bottom_tables(layout: Layout, c: int) -> BottomLayout:
+    straddle = 0
+    for start, size in layout:
+        if start < c < start + size:
+            straddle = start + size - c
+    return (tuple((start-c, size) for start, size in layout if start >= c), straddle)
+
+
+# The score of a table is -M * sum(M - pl) = -M * (size*M + sum(-pl)), which
+# is computed in constant time from the prefix sums of the negated scores.
+
+# Score of the tables of a day that start above the boundary, the top half holding
+# the c first players of the day. Also returns the max of the straddling table.
+# /!\ Supposes the scores are negated and sorted increasingly /!\
+def top_partial_score(scores: List[Score], prefix: List[Score], layout: Layout) -> Tuple[float, Score]:
+    c = len(scores)
+    value = 0.0
+    for start, size in layout:
+        M = -scores[start]
+        if start + size <= c:
+            value -= M * (size*M + prefix[start+size] - prefix[start])
+        else:
+            return (value - M * (size*M + prefix[c] - prefix[start]), M)
+    return (value, 0.0)
+
+
+# Score of the tables of a day that start below the boundary, and sum of the
+# bottom players of the straddling table (to be multiplied by its max)
+# /!\ Supposes the scores are negated and sorted increasingly /!\
+def bottom_partial_score(scores: List[Score], prefix: List[Score], tables: BottomLayout) -> Tuple[float, Score]:
+    layout, straddle = tables
+    value = 0.0
+    for start, size in layout:
+        M = -scores[start]
+        value -= M * (size*M + prefix[start+size] - prefix[start])
+    return (value, -prefix[straddle])
+
+
+def group_by_score(playersInfo: PlayersInfo, players: List[Name]) -> ScoreGroups:
+    playersOfScore: Dict[Score, List[Name]] = {}
+    for player in players:
+        playersOfScore.setdefault(playersInfo[player].score, []).append(player)
+    return sorted(playersOfScore.items(), reverse=True)
+
+
+##
+# Enumerates how many players of each score group go on day 1, in Gray code
+# order so that each step moves a single player to the other day.
+# Along with the counts, yields the scores of each day and their prefix sums.
+# The scores are negated and sorted increasingly so that bisect keeps them sorted.
+# /!\ The yielded lists are updated in place by the next step /!\
+##
+def iter_half(fixedScores: Tuple[List[Score], List[Score]], groups: ScoreGroups
+              ) -> Iterator[Tuple[Counts, List[Score], List[Score], List[Score], List[Score]]]:
+    day1Scores = sorted(-score for score in fixedScores[0])
+    day2Scores = sorted([-score for score in fixedScores[1]]
+                        + [-score for score, names in groups for _ in names])
+    counts = [0] * len(groups)
+    directions = [1] * len(groups)
+    while True:
+        yield (tuple(counts), day1Scores, [0.0] + list(accumulate(day1Scores)),
+                              day2Scores, [0.0] + list(accumulate(day2Scores)))
+        # Reflected Gray code: move the first group that can go on in its direction
+        j = 0
+        while j < len(groups) and not (0 <= counts[j] + directions[j] <= len(groups[j][1])):
+            directions[j] = -directions[j]
+            j += 1
+        if j == len(groups):
+            return
+        counts[j] += directions[j]
+        score = -groups[j][0]
+        fromScores, toScores = (day2Scores, day1Scores) if directions[j] == 1 else (day1Scores, day2Scores)
+        del fromScores[bisect_left(fromScores, score)]
+        insort(toScores, score)
+
+
+# The partial scores come from prefix sums, which do not round like get_tables_score:
+# scores this close are ties, left to the final ranking with get_tables_score
+def same_score(a: float, b: float) -> bool:
+    return isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def keep_best(best: HalfScores, key: Straddle, value: float, counts: Counts) -> None:
+    entry = best.get(key)
+    if entry is None or (value > entry[0] and not same_score(value, entry[0])):
+        best[key] = (value, [counts])
+    elif same_score(value, entry[0]):
+        best[key] = (max(value, entry[0]), entry[1])
+        entry[1].append(counts)
+
+
+##
+# The other half adds key[0]*x + key[1]*y with x, y >= 0 (scores are nonnegative),
+# so an entry can never win if another one has larger or equal keys and a strictly
+# larger value (not a tie for same_score). Such entries are removed, sweeping by decreasing key[0] with a
+# Fenwick tree giving the best value seen among the keys[1] larger or equal.
+##
+def pareto_front(best: HalfScores) -> HalfScores:
+    ranks = {y: i+1 for i, y in enumerate(sorted({key[1] for key in best}, reverse=True))}
+    tree = [float("-inf")] * (len(ranks) + 1)
+    front = {}
+    for key in sorted(best, reverse=True):
+        value = best[key][0]
+        bestSeen = float("-inf")
+        i = ranks[key[1]]
+        while i > 0:
+            bestSeen = max(bestSeen, tree[i])
+            i -= i & -i
+        if bestSeen <= value or same_score(bestSeen, value):
+            front[key] = best[key]
+        i = ranks[key[1]]
+        while i < len(tree):
+            tree[i] = max(tree[i], value)
+            i += i & -i
+    return front
+
+
+def _split_exhaustive_search(playersInfo: PlayersInfo) -> List[List[List[Name]]]:
+    day1Only = [player for player in playersInfo
+                       if playersInfo[player].daysOk == [True, False]]
+    day2Only = [player for player in playersInfo
+                       if playersInfo[player].daysOk == [False, True]]
+    order = sorted(playersInfo, key=lambda name: (-playersInfo[name].score, name))
+    day12 = [player for player in order if playersInfo[player].daysOk == [True, True]]
+
+    # Score boundary: right after the last player of the top half of day12
+    half = len(day12) // 2
+    boundary = order.index(day12[half-1]) + 1 if half > 0 else 0
+    top = set(order[0:boundary])
+    topGroups = group_by_score(playersInfo, day12[0:half])
+    bottomGroups = group_by_score(playersInfo, day12[half:])
+    topFixed = ([playersInfo[p].score for p in day1Only if p in top],
+                [playersInfo[p].score for p in day2Only if p in top])
+    bottomFixed = ([playersInfo[p].score for p in day1Only if p not in top],
+                   [playersInfo[p].score for p in day2Only if p not in top])
+    nTop = boundary
+    nTotal = len(playersInfo)
+
+    # Each half only sees the tables starting on its side of the boundary,
+    # which are the same for most day-1 counts on the other side
+    topLayouts: Dict[Tuple[int, int], Tuple[Layout, Layout]] = {}
+    bottomLayouts: Dict[Tuple[int, int], Tuple[BottomLayout, BottomLayout]] = {}
+    for c1 in range(len(topFixed[0]), len(topFixed[0]) + half + 1):
+        for b1 in range(len(bottomFixed[0]), nTotal - nTop - len(bottomFixed[1]) + 1):
+            layout1 = day_layout(c1 + b1)
+            layout2 = day_layout(nTotal - c1 - b1)
+            if layout1 is not None and layout2 is not None:
+                topLayouts[(c1, b1)] = (top_tables(layout1, c1), top_tables(layout2, nTop - c1))
+                bottomLayouts[(c1, b1)] = (bottom_tables(layout1, c1), bottom_tables(layout2, nTop - c1))
+    topBest: Dict[Tuple[int, Layout, Layout], HalfScores] = {}
+    bottomBest: Dict[Tuple[int, BottomLayout, BottomLayout], HalfScores] = {}
+    for (c1, b1) in topLayouts:
+        topBest[(c1,) + topLayouts[(c1, b1)]] = {}
+        bottomBest[(b1,) + bottomLayouts[(c1, b1)]] = {}
+    topLayoutsOfC1: Dict[int, List[Tuple[Layout, Layout, HalfScores]]] = {}
+    for (c1, layout1, layout2), best in topBest.items():
+        topLayoutsOfC1.setdefault(c1, []).append((layout1, layout2, best))
+    bottomLayoutsOfB1: Dict[int, List[Tuple[BottomLayout, BottomLayout, HalfScores]]] = {}
+    for (b1, tables1, tables2), best in bottomBest.items():
+        bottomLayoutsOfB1.setdefault(b1, []).append((tables1, tables2, best))
+
+    # Top half: best partial score for each (day-1 count above the boundary,
+    # tables starting above the boundary, straddling maxes)
+    for topCounts, scores1, prefix1, scores2, prefix2 in iter_half(topFixed, topGroups):
+        partials1: Dict[Layout, Tuple[float, Score]] = {}
+        partials2: Dict[Layout, Tuple[float, Score]] = {}
+        for layout1, layout2, best in topLayoutsOfC1.get(len(scores1), []):
+            if layout1 not in partials1:
+                partials1[layout1] = top_partial_score(scores1, prefix1, layout1)
+            if layout2 not in partials2:
+                partials2[layout2] = top_partial_score(scores2, prefix2, layout2)
+            value1, M1 = partials1[layout1]
+            value2, M2 = partials2[layout2]
+            keep_best(best, (M1, M2), value1 + value2, topCounts)
+
+    # Bottom half: best partial score for each (day-1 count below the boundary,
+    # tables starting below the boundary, sums in the straddling tables)
+    for bottomCounts, scores1, prefix1, scores2, prefix2 in iter_half(bottomFixed, bottomGroups):
+        bottomPartials1: Dict[BottomLayout, Tuple[float, Score]] = {}
+        bottomPartials2: Dict[BottomLayout, Tuple[float, Score]] = {}
+        for tables1, tables2, best in bottomLayoutsOfB1.get(len(scores1), []):
+            if tables1 not in bottomPartials1:
+                bottomPartials1[tables1] = bottom_partial_score(scores1, prefix1, tables1)
+            if tables2 not in bottomPartials2:
+                bottomPartials2[tables2] = bottom_partial_score(scores2, prefix2, tables2)
+            value1, straddleSum1 = bottomPartials1[tables1]
+            value2, straddleSum2 = bottomPartials2[tables2]
+            keep_best(best, (straddleSum1, straddleSum2), value1 + value2, bottomCounts)
+
+    topBest = {key: pareto_front(best) for key, best in topBest.items()}
+    bottomBest = {key: pareto_front(best) for key, best in bottomBest.items()}
+
+    # Join the halves sharing the same day-1 counts on both sides of the boundary
+    bestScore: Optional[float] = None
+    bestCounts: List[Tuple[List[Counts], List[Counts]]] = []
+    for (c1, b1), layoutPair in topLayouts.items():
+        topHalf = topBest.get((c1,) + layoutPair, {})
+        bottomHalf = bottomBest.get((b1,) + bottomLayouts[(c1, b1)], {})
+        for (M1, M2), (topValue, topCountsList) in topHalf.items():
+            for (straddleSum1, straddleSum2), (bottomValue, bottomCountsList) in bottomHalf.items():
+                score = topValue + bottomValue + M1*straddleSum1 + M2*straddleSum2
+                if bestScore is None or (score > bestScore and not same_score(score, bestScore)):
+                    bestScore = score
+                    bestCounts = [(topCountsList, bottomCountsList)]
+                elif same_score(score, bestScore):
+                    bestScore = max(score, bestScore)
+                    bestCounts.append((topCountsList, bottomCountsList))
+
+    # Among the best main scores, pick using the full score (with the subscore)
+    bestTables: List[List[List[Name]]] = []
+    bestFullScore: Optional[Tuple[float, float]] = None
+    for topCountsList, bottomCountsList in bestCounts:
+        for topCounts, bottomCounts in product(topCountsList, bottomCountsList):
+            day1Players = list(day1Only)
+            day2Players = list(day2Only)
+            for (_, names), count in zip(topGroups + bottomGroups, topCounts + bottomCounts):
+                day1Players.extend(names[0:count])
+                day2Players.extend(names[count:])
+            tables = create_tables_fixed_days(playersInfo, day1Players, day2Players)
+            assert(tables is not None)
+            fullScore = get_tables_score(playersInfo, tables)
+            if bestFullScore is None or fullScore > bestFullScore:
+                bestTables = [tables]
+                bestFullScore = fullScore
+            elif fullScore == bestFullScore:
+                bestTables.append(tables)
+    return bestTables
+
+
+@timeout(30)
+def split_exhaustive_search(playersInfo: PlayersInfo) -> Optional[Solution]:
+    bestTables = _split_exhaustive_search(playersInfo)
+    if not bestTables:
+        return None
+    return tables_to_solution(playersInfo, rng.choice(bestTables))
+
+
+def solution_tables(solution: Solution) -> List[List[Name]]:
+    tables: Dict[Table, List[Name]] = {}
+    for player in solution:
+        tables.setdefault(solution[player].table, []).append(player)
+    return [tables[table] for table in sorted(tables)]
+
+
+def test_split_exhaustive_search() -> None:
+    def check_same_as_exhaustive(playersInfo: PlayersInfo) -> None:
+        expected = exhaustive_search(playersInfo)
+        solution = split_exhaustive_search(playersInfo)
+        if expected is None:
+            assert(solution is None)
+            return
+        assert(solution is not None and check_solution(playersInfo, solution))
+        assert(get_tables_score(playersInfo, solution_tables(solution))
+               == get_tables_score(playersInfo, solution_tables(expected)))
+
+    testRng = rd.Random(0)
+    for i in range(60):
+        # Multiples of 2.5 round exactly, tenths do not
+        scale = 2.5 if i % 2 == 0 else 0.1
+        check_same_as_exhaustive({"p" + str(j): PI(testRng.randrange(0, int(50 / scale)) * scale,
+                                                   testRng.choice([[True, True], [True, True], [True, False], [False, True]]))
+                                  for j in range(testRng.randrange(8, 15))})
+
+    # Ties on the main score that only show up with rounding errors
+    scores = [94.9, 211.7, 175.2, 167.9, 197.1, 65.7, 14.6, 160.6, 211.7, 131.4]
+    daysOk = [[False, True], [True, False], [True, True], [True, True], [True, True],
+              [True, False], [True, True], [True, False], [False, True], [True, True]]
+    check_same_as_exhaustive({"p" + str(j): PI(score, days) for j, (score, days) in enumerate(zip(scores, daysOk))})
+
+    groups = [(3., ["a", "b"]), (2., ["c"]), (1., ["d", "e", "f"])]
+    allCounts = [counts for counts, _, _, _, _ in iter_half(([], []), groups)]
+    assert(sorted(allCounts) == sorted(product(range(3), range(2), range(4))))
+
+    print("All good!")
+
+
+# 40 players available both days with distinct scores, which has to fit in the timeout
+def bench_split_exhaustive_search() -> None:
+    scores = rd.Random(0).sample(range(1000), 56)
+    playersInfo = {"p" + str(i): PI(score / 20., [i < 48, i < 40 or i >= 48])
+                   for i, score in enumerate(scores)}
+    start = time.monotonic()
+    solution = split_exhaustive_search(playersInfo)
+    assert(solution is not None and check_solution(playersInfo, solution))
+    print("split_exhaustive_search: {:.1f}s".format(time.monotonic() - start))
+
+
 def compute_solution(playersInfo: PlayersInfo) -> Optional[List[Solution]]:
     solutions = []
     try:
-        solution = exhaustive_search(playersInfo)
+        solution = split_exhaustive_search(playersInfo)
         if solution is not None:
             print(20*"#" + " exhaustive search suggestion " + 20*"#")
             print_solution(playersInfo, solution)
@@ -458,12 +858,238 @@ def compute_solution(playersInfo: PlayersInfo) -> Optional[List[Solution]]:
         print("group_and_swap failed (No solution)")
     return solutions
 
+
+##
+# Service mode: a long-running process reading one JSON request per line and
+# streaming JSON answers back, so that the imports and the search state stay
+# warm between two signups.
+#
+# Request:  {"id": "42", "budget": 5.0,
+#            "players": [{"name": "Keket", "score": 33.5, "days": [1, 0]}, ...]}
+# Answers:  {"id": "42", "type": "progress", "explored": 512, "total": 4096, "score": [...]}
+#           {"id": "42", "type": "result", "complete": true, "cached": false, "score": [...], "tables": [...]}
+#           {"id": "42", "type": "error", "message": "..."}
+##
+RosterKey = FrozenSet[Tuple[Name, Score, bool, bool]]
+
+defaultBudget = 5.0 # seconds
+splitShare = 0.5 # part of the budget given to split_exhaustive_search
+cacheSize = 32
+
+
+def roster_key(playersInfo: PlayersInfo) -> RosterKey:
+    return frozenset((name, pi.score, pi.daysOk[0], pi.daysOk[1])
+                     for name, pi in playersInfo.items())
+
+
+def parse_roster(players: List[Dict[str, Any]]) -> PlayersInfo:
+    playersInfo: PlayersInfo = {}
+    for player in players:
+        name = str(player["name"])
+        daysOk = [bool(day) for day in player["days"]]
+        if len(daysOk) != nDays:
+            raise ValueError("player {} should have {} days".format(name, nDays))
+        if not any(daysOk):
+            continue
+        if name in playersInfo:
+            raise ValueError("player {} appears twice".format(name))
+        playersInfo[name] = PI(float(player["score"]), daysOk)
+    return playersInfo
+
+
+class Service():
+    def __init__(self, output: TextIO) -> None:
+        self.output = output
+        self.cache: "OrderedDict[RosterKey, SearchState]" = OrderedDict()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self.output.write(json.dumps(message) + "\n")
+        self.output.flush()
+
+    # Closest cached roster, i.e. the one with the fewest players added, removed or changed
+    def closest_state(self, key: RosterKey) -> Optional[SearchState]:
+        closest = None
+        closestDistance = None
+        for otherKey, state in self.cache.items():
+            distance = len(key ^ otherKey)
+            if state.bestTables and (closestDistance is None or distance < closestDistance):
+                closest = state
+                closestDistance = distance
+        return closest
+
+    def get_state(self, playersInfo: PlayersInfo) -> Tuple[SearchState, bool]:
+        key = roster_key(playersInfo)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return (self.cache[key], True)
+        closest = self.closest_state(key)
+        state = SearchState(playersInfo, closest.best_days() if closest is not None else None)
+        self.cache[key] = state
+        if len(self.cache) > cacheSize:
+            self.cache.popitem(last=False)
+        return (state, False)
+
+    def handle(self, request: Dict[str, Any]) -> None:
+        requestId = request.get("id")
+        playersInfo = parse_roster(request["players"])
+        budget = float(request.get("budget", defaultBudget))
+        deadline = time.monotonic() + budget
+        state, cached = self.get_state(playersInfo)
+
+        def progress(state: SearchState) -> None:
+            self.send({"id": requestId, "type": "progress", "explored": state.explored,
+                       "total": state.total, "score": state.bestScore})
+
+        # Have a solution before the exhaustive searches: the hint from a similar
+        # roster, or else a group_and_swap one
+        state.try_hint()
+        if not state.bestTables:
+            for i in range(100):
+                solution = group_and_swap_solution(playersInfo)
+                if solution is not None and check_solution(playersInfo, solution):
+                    state.keep(solution_tables(solution))
+                    break
+        progress(state)
+
+        # The split search is much faster but cannot be resumed: give it part of
+        # the budget, and leave the rest to the resumable search if it times out
+        splitBudget = splitShare * (deadline - time.monotonic())
+        if not state.complete and splitBudget > state.splitBudget:
+            state.splitBudget = splitBudget
+            try:
+                state.finish(timeout(splitBudget)(_split_exhaustive_search)(playersInfo))
+            except TimeoutError:
+                pass
+            progress(state)
+        state.run(deadline, progress)
+
+        tables: List[Dict[str, Any]] = []
+        if state.bestTables:
+            bestTables = rng.choice(state.bestTables)
+            solution = tables_to_solution(playersInfo, bestTables)
+            for i, tablePlayers in enumerate(bestTables):
+                tables.append({"table": i, "day": solution[tablePlayers[0]].day,
+                               "players": [{"name": player, "score": playersInfo[player].score}
+                                           for player in tablePlayers]})
+        self.send({"id": requestId, "type": "result", "complete": state.complete,
+                   "cached": cached, "explored": state.explored, "total": state.total,
+                   "score": state.bestScore, "tables": tables})
+
+    def serve(self, input: TextIO) -> None:
+        for line in input:
+            if line.strip() == "":
+                continue
+            requestId = None
+            try:
+                request = json.loads(line)
+                requestId = request.get("id")
+                self.handle(request)
+            except Exception as e:
+                self.send({"id": requestId, "type": "error",
+                           "message": "{}: {}".format(type(e).__name__, e)})
+
+
+def test_service() -> None:
+    players = [{"name": "toto", "score": 40., "days": [1, 0]},
+               {"name": "titi", "score": 30., "days": [1, 1]},
+               {"name": "tata", "score": 30., "days": [1, 0]},
+               {"name": "lolo", "score": 20., "days": [1, 1]},
+               {"name": "lili", "score": 15., "days": [0, 1]},
+               {"name": "lala", "score": 10., "days": [0, 1]},
+               {"name": "bobo", "score": 5., "days": [1, 1]},
+               {"name": "bibi", "score": 0., "days": [0, 1]}]
+    morePlayers = players + [{"name": "baba", "score": 35., "days": [1, 1]},
+                             {"name": "bubu", "score": 25., "days": [1, 1]},
+                             {"name": "nono", "score": 12.5, "days": [1, 1]},
+                             {"name": "nini", "score": 2.5, "days": [1, 1]}]
+    oneTable = players[0:3] + [{"name": "baba", "score": 35., "days": [1, 1]}]
+    requests: List[Dict[str, Any]] = [{"id": 1, "players": players},
+                                      {"id": 2, "players": players},
+                                      {"id": 3, "players": morePlayers, "budget": 0},
+                                      {"id": 4, "players": morePlayers},
+                                      {"id": 5, "players": oneTable},
+                                      {"id": 6, "players": [{"name": "toto"}]}]
+    input = io.StringIO("\n".join(json.dumps(request) for request in requests) + "\nnot json\n")
+    output = io.StringIO()
+    Service(output).serve(input)
+    answers = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert([answer["type"] for answer in answers if answer["id"] == 1] == ["progress"] * 2 + ["result"])
+    answers = [answer for answer in answers if answer["type"] != "progress"]
+    assert([answer["id"] for answer in answers] == [1, 2, 3, 4, 5, 6, None])
+    assert([answer["type"] for answer in answers] == ["result"] * 5 + ["error"] * 2)
+
+    # Identical roster: answered from the cache
+    assert(answers[0]["complete"] and not answers[0]["cached"])
+    assert(answers[1]["complete"] and answers[1]["cached"])
+    assert(answers[0]["score"] == answers[1]["score"])
+
+    # Nearly identical roster without budget: only the hint from the previous roster is tried
+    assert(not answers[2]["complete"] and not answers[2]["cached"])
+    assert(answers[2]["explored"] == 1 and answers[2]["tables"])
+
+    # Same roster again with a budget: solved by the split search
+    assert(answers[3]["complete"] and answers[3]["cached"])
+
+    for request, answer in zip(requests, answers[0:5]):
+        playersInfo = parse_roster(request["players"])
+        solution = {player["name"]: PA(table["day"], table["table"])
+                    for table in answer["tables"] for player in table["players"]}
+        assert(check_solution(playersInfo, solution))
+        if answer["complete"]:
+            expected = exhaustive_search(playersInfo)
+            assert(expected is not None)
+            assert(tuple(answer["score"]) == get_tables_score(playersInfo, solution_tables(expected)))
+
+    # Roster too large for the split search within the budget: still answered with tables
+    testRng = rd.Random(0)
+    scores = testRng.sample(range(1000), 50)
+    largePlayers = [{"name": "p" + str(i), "score": score / 20., "days": [i < 45, i < 40 or i >= 45]}
+                    for i, score in enumerate(scores)]
+    output = io.StringIO()
+    Service(output).serve(io.StringIO(json.dumps({"id": 1, "players": largePlayers, "budget": 0.5})))
+    answers = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert([answer["type"] for answer in answers][-1] == "result")
+    assert(len(answers) >= 3) # progress before and after the split search
+    assert(not answers[-1]["complete"] and answers[-1]["tables"])
+    solution = {player["name"]: PA(table["day"], table["table"])
+                for table in answers[-1]["tables"] for player in table["players"]}
+    assert(check_solution(parse_roster(largePlayers), solution))
+
+    # Fallback search stopped by its deadline, then resumed up to the end
+    playersInfo = parse_roster(morePlayers)
+    state = SearchState(playersInfo)
+    state.run(time.monotonic())
+    assert(not state.complete and state.explored == 0)
+    state.run()
+    assert(state.complete and state.explored == state.total)
+    assert(state.bestScore == get_tables_score(playersInfo, state.bestTables[0]))
+    assert(state.bestScore == get_tables_score(playersInfo, _split_exhaustive_search(playersInfo)[0]))
+
+    print("All good!")
+
+
 parser = argparse.ArgumentParser()
-parser.add_argument("file")
+parser.add_argument("file", nargs="?")
+parser.add_argument("--serve", action="store_true",
+                    help="answer JSON-lines matchmaking requests on stdin")
 args = parser.parse_args()
+if args.file is None and not args.serve:
+    parser.error("a score file is required unless --serve is given")
+
+print("Seed:", seed, file=(sys.stderr if args.serve else sys.stdout))
+
+if args.serve:
+    Service(sys.stdout).serve(sys.stdin)
+    sys.exit(0)
 
 if args.file == "test":
     test_check_solution()
+    test_service()
+    test_split_exhaustive_search()
+    sys.exit(0)
+
+if args.file == "bench":
+    bench_split_exhaustive_search()
     sys.exit(0)
 
 with open(args.file, 'r') as f:
@@ -13,11 +13,11 @@ def timeout(seconds=10, error_message=os.strerror(errno.ETIME)):
 
         def wrapper(*args, **kwargs):
             signal.signal(signal.SIGALRM, _handle_timeout)
-            signal.alarm(seconds)
+            signal.setitimer(signal.ITIMER_REAL, seconds)
             try:
                 result = func(*args, **kwargs)
             finally:
-                signal.alarm(0)
+                signal.setitimer(signal.ITIMER_REAL, 0)
             return result
 
         return wraps(func)(wrapper)